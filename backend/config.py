@@ -18,6 +18,15 @@ class Settings(BaseSettings):
     
     # Database
     database_url: str = "sqlite:///./storage/database.db"
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    
+    # Image pipeline ("" = auto-detect cuda > mps > cpu)
+    pipeline_device: str = ""
+    # Inference backend: "torch" or "onnx" (requires onnxruntime)
+    pipeline_backend: str = "torch"
+    # Dynamic INT8 quantization of the ViT classifiers (CPU, torch backend only)
+    pipeline_quantize_cpu: bool = False
     
     # File Storage
     upload_dir: str = "./storage/uploads"
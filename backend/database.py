@@ -4,54 +4,140 @@ Implements storage for analysis results and chat logs.
 """
 
 import uuid
+from collections import OrderedDict
 from datetime import datetime
 from typing import Optional
-from sqlalchemy import create_engine, Column, String, Text, DateTime, Integer, ForeignKey, text
+
+import orjson
+from sqlalchemy import create_engine, event, Column, String, Text, DateTime, Integer, ForeignKey, Index, desc, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.orm import sessionmaker, relationship, load_only
+from sqlalchemy.pool import QueuePool
 
 from .config import get_settings, DATABASE_PATH
 
-# Create engine with SQLite optimizations
+settings = get_settings()
+
+# Create engine with SQLite optimizations. A real pool (not one shared connection)
+# lets WAL readers run concurrently on separate connections.
 engine = create_engine(
     f"sqlite:///{DATABASE_PATH}",
     connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
+    poolclass=QueuePool,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
     echo=False
 )
 
-# Enable WAL mode for better concurrency
+# Async engine for request handlers and workers (shares the same WAL database file)
+async_engine = create_async_engine(
+    f"sqlite+aiosqlite:///{DATABASE_PATH}",
+    connect_args={"check_same_thread": False},
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    echo=False
+)
+
+# Per-connection PRAGMAs (safe under WAL)
+SQLITE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",   # 256 MiB
+    "PRAGMA cache_size=-65536",     # 64 MiB
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA wal_autocheckpoint=1000",
+)
+
+
+@event.listens_for(engine, "connect")
+@event.listens_for(async_engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply PRAGMAs to every new pooled connection."""
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+# Enable WAL mode for better concurrency (persistent, stored in the DB file)
 with engine.connect() as conn:
     conn.execute(text("PRAGMA journal_mode=WAL"))
-    conn.execute(text("PRAGMA synchronous=NORMAL"))
     conn.commit()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
 Base = declarative_base()
 
 
-def get_db():
-    """Dependency for getting database session."""
-    db = SessionLocal()
-    try:
+async def get_db():
+    """Dependency for getting async database session."""
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+# Parsed JSON columns keyed by (analysis_id, updated_at timestamp), least recently used first
+MAX_CACHED_JSON = 512
+_json_cache: "OrderedDict[tuple, object]" = OrderedDict()
+
+
+def load_json_cached(analysis_id: str, updated_at_ts: float, blob: str):
+    """
+    Parse a JSON column, cached per analysis row version.
+    
+    Keyed by (analysis_id, updated_at) only, so a hit never hashes or compares the
+    blob itself; the entry is invalidated whenever the row is rewritten.
+    The returned object is shared between callers and must not be mutated.
+    """
+    key = (analysis_id, updated_at_ts)
+    value = _json_cache.get(key)
+    if value is None:
+        value = orjson.loads(blob)
+        _json_cache[key] = value
+        if len(_json_cache) > MAX_CACHED_JSON:
+            _json_cache.popitem(last=False)
+    else:
+        _json_cache.move_to_end(key)
+    return value
+
+
+# Typed result count columns and the JSON path each was stored under in json_result
+RESULT_COLUMNS = (
+    ("total_faces", "$.total_faces"),
+    ("male_count", "$.gender.male"),
+    ("female_count", "$.gender.female"),
+    ("age_10s", '$.age_group."10s"'),
+    ("age_20s", '$.age_group."20s"'),
+    ("age_30s", '$.age_group."30s"'),
+    ("age_40_plus", "$.age_group.40_plus"),
+)
 
 
 class Analysis(Base):
     """Model for storing image analysis results."""
     __tablename__ = "analyses"
+    __table_args__ = (
+        # Supports list_analyses: ORDER BY created_at DESC LIMIT n
+        Index("ix_analyses_created_desc", desc("created_at")),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     analysis_id = Column(String(36), unique=True, index=True, nullable=False)
-    json_result = Column(Text, nullable=False)  # JSON string
+    json_result = Column(Text, nullable=False)  # JSON string (error details for failed analyses)
     image_paths = Column(Text, nullable=True)   # JSON array of paths
     status = Column(String(20), default="pending")  # pending, processing, completed, failed
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Result counts
+    total_faces = Column(Integer, nullable=False, default=0)
+    male_count = Column(Integer, nullable=False, default=0)
+    female_count = Column(Integer, nullable=False, default=0)
+    age_10s = Column(Integer, nullable=False, default=0)
+    age_20s = Column(Integer, nullable=False, default=0)
+    age_30s = Column(Integer, nullable=False, default=0)
+    age_40_plus = Column(Integer, nullable=False, default=0)
+    
     # Relationship to chat logs
     chat_logs = relationship("ChatLog", back_populates="analysis", cascade="all, delete-orphan")
     
@@ -59,11 +145,46 @@ class Analysis(Base):
     def generate_id() -> str:
         """Generate a new unique analysis ID."""
         return str(uuid.uuid4())
+    
+    def set_result(self, result: dict):
+        """Store the pipeline's aggregated result in the count columns."""
+        gender = result.get("gender", {})
+        age_group = result.get("age_group", {})
+        self.total_faces = result.get("total_faces", 0)
+        self.male_count = gender.get("male", 0)
+        self.female_count = gender.get("female", 0)
+        self.age_10s = age_group.get("10s", 0)
+        self.age_20s = age_group.get("20s", 0)
+        self.age_30s = age_group.get("30s", 0)
+        self.age_40_plus = age_group.get("40_plus", 0)
+    
+    def result_dict(self) -> dict:
+        """Result counts in the pipeline's JSON layout."""
+        return {
+            "total_faces": self.total_faces,
+            "gender": {"male": self.male_count, "female": self.female_count},
+            "age_group": {
+                "10s": self.age_10s,
+                "20s": self.age_20s,
+                "30s": self.age_30s,
+                "40_plus": self.age_40_plus
+            }
+        }
+    
+    def image_path_list(self) -> list:
+        """Parsed image_paths (cached)."""
+        if not self.image_paths:
+            return []
+        return load_json_cached(self.analysis_id, self.updated_at.timestamp(), self.image_paths)
 
 
 class ChatLog(Base):
     """Model for storing chat history."""
     __tablename__ = "chat_logs"
+    __table_args__ = (
+        # Supports get_chat_history: WHERE analysis_id = ? ORDER BY created_at
+        Index("ix_chatlog_analysis_created", "analysis_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     analysis_id = Column(String(36), ForeignKey("analyses.analysis_id"), nullable=False, index=True)
@@ -75,11 +196,59 @@ class ChatLog(Base):
     analysis = relationship("Analysis", back_populates="chat_logs")
 
 
+# Loader option for reads that only need the status and result counts,
+# so the json_result / image_paths text columns are never fetched
+RESULT_ONLY = load_only(
+    Analysis.status,
+    Analysis.created_at,
+    *(getattr(Analysis, column) for column, _ in RESULT_COLUMNS)
+)
+
+
+class LLMCache(Base):
+    """Model for caching LLM answers by content hash."""
+    __tablename__ = "llm_cache"
+    
+    key = Column(String(64), primary_key=True)  # SHA-256 of (model, prompt, JSON data, question)
+    answer = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 def init_db():
     """Initialize database tables."""
     Base.metadata.create_all(bind=engine)
+    
+    # Migrate databases created before the result count columns existed
+    with engine.begin() as conn:
+        existing = {row[1] for row in conn.execute(text("PRAGMA table_info(analyses)"))}
+        missing = [(column, path) for column, path in RESULT_COLUMNS if column not in existing]
+        for column, _ in missing:
+            conn.execute(text(f"ALTER TABLE analyses ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0"))
+        if missing:
+            assignments = ", ".join(
+                f"{column} = COALESCE(json_extract(json_result, '{path}'), 0)" for column, path in missing
+            )
+            conn.execute(text(f"UPDATE analyses SET {assignments} WHERE status = 'completed'"))
+    
+    # Analyses left "processing" by a previous run were lost with its queue;
+    # make them startable again
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE analyses SET status = 'pending' WHERE status = 'processing'"))
+    
+    # create_all skips indexes on tables that already exist
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
     print("Database initialized successfully!")
 
 
+def optimize_db():
+    """Run PRAGMA optimize to refresh query planner statistics."""
+    with engine.connect() as conn:
+        conn.execute(text("PRAGMA optimize"))
+        conn.commit()
+
+
 if __name__ == "__main__":
     init_db()
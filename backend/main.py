@@ -3,14 +3,19 @@ FastAPI Backend Server for Face Detection Chatbot.
 Main entry point for the API.
 """
 
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
 from .config import get_settings, UPLOAD_DIR
-from .database import init_db
+from .database import init_db, optimize_db
 from .routers import upload, analyze, chat
+from .services.chat_log_writer import get_chat_log_writer
+from .services.llm_service import get_llm_service
+from .services.pipeline_service import get_pipeline_service
+from .services.task_queue import get_analysis_queue
 
 
 @asynccontextmanager
@@ -20,9 +25,22 @@ async def lifespan(app: FastAPI):
     print("🚀 Starting Face Detection Chatbot API...")
     init_db()
     print("✅ Database initialized")
+    # Front-load model loading and the LLM connection so the first requests run warm
+    warm_ups = [asyncio.to_thread(get_pipeline_service().warm_up)]
+    if get_settings().openai_api_key:
+        warm_ups.append(get_llm_service().warm_up())
+    await asyncio.gather(*warm_ups)
+    print("✅ Warm-up finished")
+    chat_log_writer = get_chat_log_writer()
+    chat_log_writer.start()
+    analysis_queue = get_analysis_queue()
+    analysis_queue.start()
     yield
     # Shutdown
     print("👋 Shutting down...")
+    await analysis_queue.stop()
+    await chat_log_writer.stop()
+    optimize_db()
 
 
 # Create FastAPI app
@@ -77,6 +95,7 @@ async def root():
             "analyze": "POST /api/analyze/{analysis_id}",
             "result": "GET /api/result/{analysis_id}",
             "chat": "POST /api/chat",
+            "chat_batch": "POST /api/chat/batch",
             "history": "GET /api/history/{analysis_id}"
         }
     }
@@ -2,30 +2,34 @@
 Chat Router: Handles LLM-based Q&A about analysis results.
 """
 
-import json
+import asyncio
 from datetime import datetime
+from typing import List
 
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select, exists
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..database import get_db, Analysis, ChatLog
+from ..database import get_db, Analysis, ChatLog, RESULT_ONLY
 from ..services.llm_service import get_llm_service
-from ..schemas.models import ChatRequest, ChatResponse, ChatHistoryResponse, ChatHistoryItem
+from ..services.chat_log_writer import get_chat_log_writer
+from ..schemas.models import (
+    ChatRequest, ChatResponse, ChatHistoryResponse, ChatHistoryItem, SummaryResponse, AnalysisResult
+)
 
 router = APIRouter(prefix="/api", tags=["chat"])
 
+# Most questions accepted by one /chat/batch request
+MAX_BATCH_QUESTIONS = 32
+# Most LLM calls a batch request runs at once
+MAX_CONCURRENT_ANSWERS = 8
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat(
-    request: ChatRequest,
-    db: Session = Depends(get_db)
-):
-    """
-    Ask a question about analysis results.
-    The LLM answers based ONLY on the JSON data - no hallucination.
-    """
-    # Get analysis
-    analysis = db.query(Analysis).filter(Analysis.analysis_id == request.analysis_id).first()
+
+async def _load_completed_result(db: AsyncSession, analysis_id: str) -> dict:
+    """Fetch a completed analysis and return its result counts."""
+    analysis = await db.scalar(
+        select(Analysis).options(RESULT_ONLY).where(Analysis.analysis_id == analysis_id)
+    )
     
     if not analysis:
         raise HTTPException(status_code=404, detail="Analysis not found")
@@ -36,24 +40,32 @@ async def chat(
             detail=f"Analysis not completed. Status: {analysis.status}"
         )
     
-    # Parse JSON result
-    try:
-        json_data = json.loads(analysis.json_result)
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=500, detail="Invalid analysis result format")
+    return analysis.result_dict()
+
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat(
+    request: ChatRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Ask a question about analysis results.
+    The LLM answers based ONLY on the JSON data - no hallucination.
+    """
+    json_data = await _load_completed_result(db, request.analysis_id)
     
     # Get LLM answer
     llm_service = get_llm_service()
-    answer = llm_service.answer_question(json_data, request.question)
+    answer = await llm_service.answer_question(json_data, request.question)
     
-    # Log the chat
+    # Log the chat (written in the background, batched with other logs)
     chat_log = ChatLog(
         analysis_id=request.analysis_id,
         question=request.question,
-        answer=answer
+        answer=answer,
+        created_at=datetime.utcnow()
     )
-    db.add(chat_log)
-    db.commit()
+    get_chat_log_writer().enqueue(chat_log)
     
     return ChatResponse(
         analysis_id=request.analysis_id,
@@ -63,22 +75,81 @@ async def chat(
     )
 
 
+@router.post("/chat/batch", response_model=List[ChatResponse])
+async def chat_batch(
+    requests: List[ChatRequest],
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Ask several questions at once.
+    LLM calls run concurrently and all chat logs are saved in one transaction.
+    """
+    if not requests:
+        raise HTTPException(status_code=400, detail="No questions provided")
+    if len(requests) > MAX_BATCH_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many questions: at most {MAX_BATCH_QUESTIONS} per batch"
+        )
+    
+    json_by_id = {}
+    for request in requests:
+        if request.analysis_id not in json_by_id:
+            json_by_id[request.analysis_id] = await _load_completed_result(db, request.analysis_id)
+    
+    # Get LLM answers concurrently, a bounded number at a time
+    llm_service = get_llm_service()
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_ANSWERS)
+    
+    async def answer(request: ChatRequest) -> str:
+        async with semaphore:
+            return await llm_service.answer_question(json_by_id[request.analysis_id], request.question)
+    
+    answers = await asyncio.gather(*[answer(request) for request in requests])
+    
+    # Log all chats in a single transaction
+    now = datetime.utcnow()
+    chat_logs = [
+        ChatLog(
+            analysis_id=request.analysis_id,
+            question=request.question,
+            answer=answer,
+            created_at=now
+        )
+        for request, answer in zip(requests, answers)
+    ]
+    db.add_all(chat_logs)
+    await db.commit()
+    
+    return [
+        ChatResponse(
+            analysis_id=log.analysis_id,
+            question=log.question,
+            answer=log.answer,
+            created_at=log.created_at
+        )
+        for log in chat_logs
+    ]
+
+
 @router.get("/history/{analysis_id}", response_model=ChatHistoryResponse)
 async def get_chat_history(
     analysis_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get chat history for an analysis."""
     # Verify analysis exists
-    analysis = db.query(Analysis).filter(Analysis.analysis_id == analysis_id).first()
+    analysis_exists = await db.scalar(select(exists().where(Analysis.analysis_id == analysis_id)))
     
-    if not analysis:
+    if not analysis_exists:
         raise HTTPException(status_code=404, detail="Analysis not found")
     
     # Get chat logs
-    logs = db.query(ChatLog).filter(
-        ChatLog.analysis_id == analysis_id
-    ).order_by(ChatLog.created_at.asc()).all()
+    logs = (await db.scalars(
+        select(ChatLog).where(
+            ChatLog.analysis_id == analysis_id
+        ).order_by(ChatLog.created_at.asc())
+    )).all()
     
     history = [
         ChatHistoryItem(
@@ -95,30 +166,19 @@ async def get_chat_history(
     )
 
 
-@router.get("/summary/{analysis_id}")
+@router.get("/summary/{analysis_id}", response_model=SummaryResponse)
 async def get_summary(
     analysis_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get a natural language summary of the analysis results."""
-    analysis = db.query(Analysis).filter(Analysis.analysis_id == analysis_id).first()
-    
-    if not analysis:
-        raise HTTPException(status_code=404, detail="Analysis not found")
-    
-    if analysis.status != "completed":
-        raise HTTPException(
-            status_code=400,
-            detail=f"Analysis not completed. Status: {analysis.status}"
-        )
-    
-    json_data = json.loads(analysis.json_result)
+    json_data = await _load_completed_result(db, analysis_id)
     
     llm_service = get_llm_service()
-    summary = llm_service.get_summary(json_data)
+    summary = await llm_service.get_summary(json_data)
     
-    return {
-        "analysis_id": analysis_id,
-        "summary": summary,
-        "raw_data": json_data
-    }
+    return SummaryResponse(
+        analysis_id=analysis_id,
+        summary=summary,
+        raw_data=AnalysisResult.model_validate(json_data)
+    )
@@ -3,36 +3,71 @@ Upload Router: Handles image upload and storage.
 """
 
 import os
-import json
 import uuid
-import shutil
+import asyncio
+import hashlib
 from pathlib import Path
 from typing import List
 from datetime import datetime
 
+import aiofiles
+import orjson
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..database import get_db, Analysis
 from ..config import UPLOAD_DIR
-from ..schemas.models import UploadResponse, ErrorResponse
+from ..schemas.models import UploadResponse, UploadInfoResponse, ErrorResponse
 
 router = APIRouter(prefix="/api", tags=["upload"])
 
-# Allowed image extensions
-ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+# Allowed image extensions (lowercase, without the dot)
+ALLOWED_EXTENSIONS = frozenset({"jpg", "jpeg", "png", "bmp", "webp"})
+
+# Read/write uploads in 1 MiB chunks
+CHUNK_SIZE = 1 << 20
 
 
 def validate_image(filename: str) -> bool:
     """Check if file has allowed image extension."""
-    ext = Path(filename).suffix.lower()
-    return ext in ALLOWED_EXTENSIONS
+    _, dot, ext = filename.rpartition(".")
+    return bool(dot) and ext.lower() in ALLOWED_EXTENSIONS
+
+
+async def save_upload(file: UploadFile) -> Path:
+    """
+    Store an uploaded file under its SHA-256 digest.
+    
+    The upload is hashed while it streams to a temp file in one pass; if identical
+    content was already uploaded (e.g. the same photos in another analysis), the
+    temp file is dropped and the existing file is reused.
+    """
+    ext = file.filename.rpartition(".")[2].lower()
+    
+    # Write to a unique temp file and rename, so readers never see partial files
+    tmp_path = UPLOAD_DIR / f"{uuid.uuid4().hex}.{ext}.part"
+    hasher = hashlib.sha256()
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out:
+            while chunk := await file.read(CHUNK_SIZE):
+                hasher.update(chunk)
+                await out.write(chunk)
+        
+        file_path = UPLOAD_DIR / f"{hasher.hexdigest()}.{ext}"
+        if not file_path.exists():
+            os.replace(tmp_path, file_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    
+    return file_path
 
 
 @router.post("/upload", response_model=UploadResponse)
 async def upload_images(
     files: List[UploadFile] = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Upload multiple images for analysis.
@@ -44,42 +79,30 @@ async def upload_images(
     if not files:
         raise HTTPException(status_code=400, detail="No files provided")
     
-    # Validate files
-    for file in files:
-        if not validate_image(file.filename):
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid file type: {file.filename}. Allowed: {ALLOWED_EXTENSIONS}"
-            )
+    # Validate all file names before touching any upload stream
+    invalid = next((file for file in files if not validate_image(file.filename)), None)
+    if invalid is not None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid file type: {invalid.filename}. Allowed: {sorted(ALLOWED_EXTENSIONS)}"
+        )
     
     # Generate unique analysis ID
     analysis_id = str(uuid.uuid4())
     
-    # Create upload directory for this analysis
-    upload_path = UPLOAD_DIR / analysis_id
-    upload_path.mkdir(parents=True, exist_ok=True)
-    
-    saved_paths = []
-    
     try:
-        # Save each uploaded file
-        for file in files:
-            file_path = upload_path / file.filename
-            
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            
-            saved_paths.append(str(file_path))
+        # Save all uploaded files concurrently (content-addressed, deduplicated)
+        saved_paths = [str(path) for path in await asyncio.gather(*[save_upload(f) for f in files])]
         
         # Create analysis record in database
         analysis = Analysis(
             analysis_id=analysis_id,
             json_result="{}",  # Empty until analysis runs
-            image_paths=json.dumps(saved_paths),
+            image_paths=orjson.dumps(saved_paths).decode(),
             status="pending"
         )
         db.add(analysis)
-        db.commit()
+        await db.commit()
         
         return UploadResponse(
             analysis_id=analysis_id,
@@ -88,30 +111,28 @@ async def upload_images(
         )
         
     except Exception as e:
-        # Cleanup on error
-        if upload_path.exists():
-            shutil.rmtree(upload_path)
-        db.rollback()
+        # Stored files are content-addressed and may be shared, so only roll back the DB
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
-@router.get("/uploads/{analysis_id}")
+@router.get("/uploads/{analysis_id}", response_model=UploadInfoResponse)
 async def get_upload_info(
     analysis_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get information about uploaded images for an analysis."""
-    analysis = db.query(Analysis).filter(Analysis.analysis_id == analysis_id).first()
+    analysis = await db.scalar(select(Analysis).where(Analysis.analysis_id == analysis_id))
     
     if not analysis:
         raise HTTPException(status_code=404, detail="Analysis not found")
     
-    image_paths = json.loads(analysis.image_paths) if analysis.image_paths else []
+    image_paths = analysis.image_path_list()
     
-    return {
-        "analysis_id": analysis_id,
-        "status": analysis.status,
-        "image_count": len(image_paths),
-        "image_paths": image_paths,
-        "created_at": analysis.created_at
-    }
+    return UploadInfoResponse(
+        analysis_id=analysis_id,
+        status=analysis.status,
+        image_count=len(image_paths),
+        image_paths=image_paths,
+        created_at=analysis.created_at
+    )
@@ -9,28 +9,11 @@ from pydantic import BaseModel, Field
 
 # ==================== Analysis Schemas ====================
 
-class GenderStats(BaseModel):
-    """Gender statistics."""
-    male: int = 0
-    female: int = 0
-
-
-class AgeGroupStats(BaseModel):
-    """Age group statistics."""
-    tens: int = Field(0, alias="10s")
-    twenties: int = Field(0, alias="20s")
-    thirties: int = Field(0, alias="30s")
-    forty_plus: int = Field(0, alias="40_plus")
-    
-    class Config:
-        populate_by_name = True
-
-
 class AnalysisResult(BaseModel):
     """Complete analysis result."""
     total_faces: int = 0
-    gender: GenderStats = GenderStats()
-    age_group: AgeGroupStats = AgeGroupStats()
+    gender: dict[str, int] = Field(default_factory=dict)     # male, female
+    age_group: dict[str, int] = Field(default_factory=dict)  # 10s, 20s, 30s, 40_plus
 
 
 class AnalysisResponse(BaseModel):
@@ -42,6 +25,20 @@ class AnalysisResponse(BaseModel):
     message: Optional[str] = None
 
 
+class AnalysisListItem(BaseModel):
+    """Single row of the analysis list."""
+    analysis_id: str
+    status: str
+    image_count: int
+    total_faces: int
+    created_at: datetime
+
+
+class AnalysisListResponse(BaseModel):
+    """Response for analysis list endpoint."""
+    analyses: List[AnalysisListItem]
+
+
 class UploadResponse(BaseModel):
     """Response for upload endpoint."""
     analysis_id: str
@@ -49,6 +46,15 @@ class UploadResponse(BaseModel):
     message: str
 
 
+class UploadInfoResponse(BaseModel):
+    """Response for upload info endpoint."""
+    analysis_id: str
+    status: str
+    image_count: int
+    image_paths: List[str]
+    created_at: datetime
+
+
 # ==================== Chat Schemas ====================
 
 class ChatRequest(BaseModel):
@@ -78,6 +84,13 @@ class ChatHistoryResponse(BaseModel):
     history: List[ChatHistoryItem]
 
 
+class SummaryResponse(BaseModel):
+    """Response for summary endpoint."""
+    analysis_id: str
+    summary: str
+    raw_data: AnalysisResult
+
+
 # ==================== Error Schemas ====================
 
 class ErrorResponse(BaseModel):
@@ -0,0 +1,98 @@
+"""
+Chat Log Writer: Write-behind queue for ChatLog inserts.
+Coalesces pending chat logs so a burst of questions shares one transaction.
+"""
+
+import asyncio
+from typing import List, Optional
+
+from ..database import AsyncSessionLocal, ChatLog
+
+# Flush when this many rows are pending or after this many seconds
+MAX_BATCH_SIZE = 32
+MAX_BATCH_DELAY = 0.02
+
+# Queued by stop(): the writer flushes what it holds and exits
+_STOP = object()
+
+
+class ChatLogWriter:
+    """Background task that drains queued ChatLog rows in batched transactions."""
+
+    def __init__(self, max_batch_size: int = MAX_BATCH_SIZE, max_batch_delay: float = MAX_BATCH_DELAY):
+        self.max_batch_size = max_batch_size
+        self.max_batch_delay = max_batch_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the background writer on the running event loop."""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stop the writer, flushing anything still queued.
+        
+        Uses a sentinel instead of cancelling the task, so a batch the writer has
+        already taken off the queue is still written.
+        """
+        if self._task is None:
+            return
+        self._queue.put_nowait(_STOP)
+        await self._task
+        self._task = None
+
+    def enqueue(self, chat_log: ChatLog):
+        """Queue a chat log for writing, starting the writer if needed."""
+        self.start()
+        self._queue.put_nowait(chat_log)
+
+    async def _run(self):
+        """Drain up to max_batch_size rows or max_batch_delay seconds per flush."""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = loop.time() + self.max_batch_delay
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    # Everything enqueued before stop() is ahead of the sentinel
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                print(f"Error writing chat logs: {e}")
+
+    @staticmethod
+    async def _flush(chat_logs: List[ChatLog]):
+        """Write a batch of chat logs in a single transaction."""
+        async with AsyncSessionLocal() as db:
+            db.add_all(chat_logs)
+            await db.commit()
+
+
+# Singleton instance
+_chat_log_writer: Optional[ChatLogWriter] = None
+
+
+def get_chat_log_writer() -> ChatLogWriter:
+    """Get or create chat log writer instance."""
+    global _chat_log_writer
+    if _chat_log_writer is None:
+        _chat_log_writer = ChatLogWriter()
+    return _chat_log_writer
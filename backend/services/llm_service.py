@@ -3,11 +3,17 @@ LLM Service: GPT-4o-mini integration for answering questions about analysis resu
 The LLM only uses the provided JSON data - no hallucination allowed.
 """
 
-import json
-from typing import Optional
-from openai import OpenAI
+import re
+import hashlib
+from typing import Callable, Optional
+
+import orjson
+from openai import AsyncOpenAI
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
 
 from ..config import get_settings
+from ..database import AsyncSessionLocal, LLMCache
 
 # System prompt designed to prevent hallucination
 SYSTEM_PROMPT = """당신은 이미지 분석 결과에 대해 질문에 답변하는 도우미입니다.
@@ -27,16 +33,202 @@ SYSTEM_PROMPT = """당신은 이미지 분석 결과에 대해 질문에 답변
 - age_group: 연령대 분포 (10s, 20s, 30s, 40_plus)
 """
 
+# The system message is built once and sent first, unchanged, on every call so the
+# API's prompt prefix cache can match it; per-analysis data goes in the user message
+_SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+PROMPT_CACHE_KEY = "face-analysis-qa"
+
+# Maximum number of answers kept in the in-process cache
+MAX_CACHED_ANSWERS = 4096
+
+# Display labels for age groups
+AGE_GROUP_LABELS = {"10s": "10대 이하", "20s": "20대", "30s": "30대", "40_plus": "40대 이상"}
+
+NO_FACES_ANSWER = "분석된 이미지에서 감지된 얼굴이 없습니다."
+
+
+# ==================== Canned Answers ====================
+# Stats questions about the fixed schema are answered directly from the JSON,
+# without an LLM call.
+
+def _percent(count: int, total: int) -> str:
+    return f"{count / total * 100:.1f}%"
+
+
+def _answer_total(json_data: dict) -> str:
+    total = json_data.get("total_faces", 0)
+    if not total:
+        return NO_FACES_ANSWER
+    return f"총 {total}명의 얼굴이 감지되었습니다."
+
+
+def _answer_gender(json_data: dict) -> str:
+    total = json_data.get("total_faces", 0)
+    if not total:
+        return NO_FACES_ANSWER
+    gender = json_data.get("gender", {})
+    male, female = gender.get("male", 0), gender.get("female", 0)
+    return (
+        f"성별 분포는 남성 {male}명({_percent(male, total)}), "
+        f"여성 {female}명({_percent(female, total)})입니다."
+    )
+
+
+def _answer_age(json_data: dict) -> str:
+    total = json_data.get("total_faces", 0)
+    if not total:
+        return NO_FACES_ANSWER
+    age_group = json_data.get("age_group", {})
+    parts = [
+        f"{label} {age_group.get(key, 0)}명({_percent(age_group.get(key, 0), total)})"
+        for key, label in AGE_GROUP_LABELS.items()
+    ]
+    return f"연령대 분포는 {', '.join(parts)}입니다."
+
+
+def _answer_summary(json_data: dict) -> str:
+    if not json_data.get("total_faces", 0):
+        return NO_FACES_ANSWER
+    return " ".join([_answer_total(json_data), _answer_gender(json_data), _answer_age(json_data)])
+
+
+# Korean question endings accepted after a stats topic ("성별 분포는 어때요?")
+_KO_ENDING = (
+    r"(?:\s*(?:은|는|이|가|을|를))?"
+    r"(?:\s*(?:어때요?|어떻게\s*(?:돼요?|되나요|됩니까)|알려\s*(?:줘|주세요|줄래)"
+    r"|보여\s*(?:줘|주세요|줄래)|뭐야|무엇인가요|이에요|인가요|입니까|야))?"
+)
+# Endings after a "몇 명" count ("몇 명이에요?", "몇 명 감지됐어?")
+_KO_COUNT_ENDING = (
+    r"(?:\s*(?:이에요|인가요|이야|입니까|이죠|야|이))?"
+    r"(?:\s*(?:감지\s*(?:됐|되었)|있|나왔)(?:어요?|나요|습니까|니))?"
+)
+_KO_HOW_MANY = r"몇\s*(?:명|개)" + _KO_COUNT_ENDING
+
+
+def _template(*alternatives: str) -> re.Pattern:
+    return re.compile("|".join(f"(?:{alt})" for alt in alternatives), re.IGNORECASE)
+
+
+# Each pattern must match the whole (normalized) question. Anything with an extra
+# noun or qualifier ("몇 명이 안경을 썼어?", "a summary of women only") asks for
+# something the canned answers don't cover and goes to the LLM, which can refuse
+_INTENT_TEMPLATES: list[tuple[re.Pattern, Callable[[dict], str]]] = [
+    (_template(
+        r"(?:(?:이\s*)?(?:분석\s*)?결과\s*(?:를|을)?\s*)?(?:간단히\s*)?요약\s*(?:해\s*(?:줘|주세요|줄래))?",
+        r"(?:give\s+me\s+|show\s+me\s+)?(?:a\s+)?summary(?:\s+of\s+(?:the\s+)?(?:results|analysis))?",
+        r"summari[sz]e(?:\s+(?:the\s+)?(?:results|analysis))?",
+    ), _answer_summary),
+    (_template(
+        r"(?:총|전체)?\s*(?:(?:사람|얼굴|인원)\s*수?\s*(?:은|는|이|가)?\s*)?" + _KO_HOW_MANY,
+        r"(?:총|전체)?\s*(?:인원\s*수?|얼굴\s*수|사람\s*수)" + _KO_ENDING,
+        r"how\s+many\s+(?:people|persons|faces)(?:\s+(?:are|were)\s+(?:there|detected"
+        r"|in\s+(?:the|this|these)\s+(?:images?|photos?|pictures?)))?",
+        r"(?:what\s+is\s+|what's\s+)?(?:the\s+)?total(?:\s+number\s+of)?(?:\s+(?:people|faces))?",
+    ), _answer_total),
+    (_template(
+        r"(?:성별|성비|남녀)\s*(?:분포|비율|구성)?" + _KO_ENDING,
+        r"(?:남자|남성|여자|여성)\s*(?:는|은)?\s*" + _KO_HOW_MANY,
+        r"(?:what\s+is\s+|what's\s+)?(?:the\s+)?gender\s+(?:distribution|breakdown|ratio|split)",
+        r"how\s+many\s+(?:men|males|women|females)(?:\s+and\s+(?:men|males|women|females))?"
+        r"(?:\s+are\s+there)?",
+    ), _answer_gender),
+    (_template(
+        r"(?:연령대?|나이)\s*(?:별)?\s*(?:분포|비율|구성)?" + _KO_ENDING,
+        r"(?:[1-9]0\s*대(?:\s*(?:이하|이상))?)\s*(?:는|은)?\s*" + _KO_HOW_MANY,
+        r"(?:what\s+is\s+|what's\s+)?(?:the\s+)?age(?:\s+group)?\s+(?:distribution|breakdown)",
+    ), _answer_age),
+]
+
+
+def route_intent(json_data: dict, question: str) -> Optional[str]:
+    """
+    Answer a known stats question directly, or return None to fall through to the LLM.
+    
+    Only questions that match a stats template as a whole are answered here:
+    
+    >>> data = {"total_faces": 10, "gender": {"male": 6, "female": 4}, "age_group": {}}
+    >>> route_intent(data, "총 몇 명이에요?")
+    '총 10명의 얼굴이 감지되었습니다.'
+    >>> route_intent(data, "How many faces are there?")
+    '총 10명의 얼굴이 감지되었습니다.'
+    >>> route_intent(data, "성별 분포는?")
+    '성별 분포는 남성 6명(60.0%), 여성 4명(40.0%)입니다.'
+    >>> route_intent(data, "몇 명이 안경을 썼어?") is None
+    True
+    >>> route_intent(data, "미성년자는 몇 명?") is None
+    True
+    >>> route_intent(data, "How many people wear hats?") is None
+    True
+    >>> route_intent(data, "Give me a summary of women only") is None
+    True
+    >>> route_intent(data, "요약 말고 남자만 알려줘") is None
+    True
+    >>> route_intent(data, "20대 남자는 몇 명?") is None
+    True
+    """
+    normalized = " ".join(question.split()).rstrip("?？.!~ ")
+    for pattern, answer in _INTENT_TEMPLATES:
+        if pattern.fullmatch(normalized):
+            return answer(json_data)
+    return None
+
 
 class LLMService:
     """Service for interacting with OpenAI GPT-4o-mini."""
     
     def __init__(self):
         settings = get_settings()
-        self.client = OpenAI(api_key=settings.openai_api_key)
+        # Async client reuses pooled keep-alive HTTP connections across calls
+        self.client = AsyncOpenAI(api_key=settings.openai_api_key, max_retries=2, timeout=20.0)
         self.model = settings.openai_model
+        self._cache: dict[str, str] = {}
+    
+    def _cache_key(self, json_data: dict, question: str) -> str:
+        """Content hash of the model, system prompt, JSON data and question."""
+        hasher = hashlib.sha256()
+        for part in (self.model.encode(), SYSTEM_PROMPT.encode(),
+                     orjson.dumps(json_data, option=orjson.OPT_SORT_KEYS), question.encode()):
+            hasher.update(part)
+            hasher.update(b"\x00")
+        return hasher.hexdigest()
     
-    def answer_question(self, json_data: dict, question: str) -> str:
+    async def warm_up(self):
+        """Open the HTTP/TLS connection to the API ahead of the first question."""
+        try:
+            await self.client.chat.completions.create(
+                model=self.model,
+                messages=[_SYSTEM_MESSAGE, {"role": "user", "content": "ping"}],
+                max_tokens=1,
+                extra_body={"prompt_cache_key": PROMPT_CACHE_KEY}
+            )
+        except Exception as e:
+            print(f"Warning: LLM warm-up failed: {e}")
+    
+    async def _get_cached(self, key: str) -> Optional[str]:
+        """Look up an answer in memory, then in the llm_cache table."""
+        answer = self._cache.get(key)
+        if answer is None:
+            async with AsyncSessionLocal() as db:
+                answer = await db.scalar(select(LLMCache.answer).where(LLMCache.key == key))
+            if answer is not None:
+                self._remember(key, answer)
+        return answer
+    
+    def _remember(self, key: str, answer: str):
+        """Store an answer in the in-process cache, evicting the oldest entry when full."""
+        if len(self._cache) >= MAX_CACHED_ANSWERS:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[key] = answer
+    
+    async def _store_cached(self, key: str, answer: str):
+        """Store an answer in memory and persist it to the llm_cache table."""
+        self._remember(key, answer)
+        async with AsyncSessionLocal() as db:
+            await db.execute(insert(LLMCache).values(key=key, answer=answer).on_conflict_do_nothing())
+            await db.commit()
+    
+    async def answer_question(self, json_data: dict, question: str) -> str:
         """
         Answer a question based on the provided JSON data.
         
@@ -47,36 +239,42 @@ class LLMService:
         Returns:
             Natural language answer based on the JSON data
         """
-        # Format the JSON for the prompt
-        json_str = json.dumps(json_data, indent=2, ensure_ascii=False)
+        # Stats questions don't need the LLM at all
+        canned = route_intent(json_data, question)
+        if canned is not None:
+            return canned
         
-        # Create the user message with JSON context
-        user_message = f"""## 분석 결과 데이터
-```json
-{json_str}
-```
-
-## 사용자 질문
-{question}
-"""
+        # temperature=0 answers are deterministic, so identical questions are served from cache
+        cache_key = self._cache_key(json_data, question)
+        cached = await self._get_cached(cache_key)
+        if cached is not None:
+            return cached
+        
+        # Compact JSON inline (no indent or code fence) to keep the prompt short
+        json_str = orjson.dumps(json_data).decode()
+        user_message = f"분석 결과: {json_str}\n질문: {question}"
         
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
+                    _SYSTEM_MESSAGE,
                     {"role": "user", "content": user_message}
                 ],
                 temperature=0,  # Deterministic output for accuracy
-                max_tokens=500
+                max_tokens=500,
+                extra_body={"prompt_cache_key": PROMPT_CACHE_KEY}
             )
             
-            return response.choices[0].message.content.strip()
+            answer = response.choices[0].message.content.strip()
             
         except Exception as e:
             return f"죄송합니다. 답변을 생성하는 중 오류가 발생했습니다: {str(e)}"
+        
+        await self._store_cached(cache_key, answer)
+        return answer
     
-    def get_summary(self, json_data: dict) -> str:
+    async def get_summary(self, json_data: dict) -> str:
         """
         Generate a natural language summary of the analysis results.
         
@@ -86,8 +284,8 @@ class LLMService:
         Returns:
             Natural language summary
         """
-        question = "이 분석 결과를 간단히 요약해주세요. 총 인원 수, 성별 비율, 연령대 분포를 포함해주세요."
-        return self.answer_question(json_data, question)
+        # The summary covers exactly the stats the canned answers report
+        return _answer_summary(json_data)
 
 
 # Singleton instance
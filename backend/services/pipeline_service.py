@@ -6,6 +6,7 @@ Handles image processing and returns structured JSON results.
 import os
 import sys
 import json
+import threading
 from pathlib import Path
 from typing import List, Optional
 
@@ -15,22 +16,38 @@ sys.path.insert(0, str(PROJECT_ROOT))
 
 from image_pipeline.image_pipeline import ImagePipeline
 
+from ..config import get_settings
+
 
 class PipelineService:
     """Service for running the image analysis pipeline."""
     
-    def __init__(self, device: str = 'cpu'):
+    def __init__(self, device: Optional[str] = None, backend: str = "torch", quantize_cpu: bool = False):
         self.device = device
+        self.backend = backend
+        self.quantize_cpu = quantize_cpu
         self._pipeline: Optional[ImagePipeline] = None
+        self._lock = threading.Lock()
     
     @property
     def pipeline(self) -> ImagePipeline:
-        """Lazy-load the pipeline (models are heavy)."""
+        """Lazy-load the pipeline (models are heavy). Warmed at server startup."""
         if self._pipeline is None:
-            print("Initializing image pipeline (this may take a moment)...")
-            self._pipeline = ImagePipeline(device=self.device)
+            with self._lock:
+                if self._pipeline is None:
+                    print("Initializing image pipeline (this may take a moment)...")
+                    self._pipeline = ImagePipeline(
+                        device=self.device, backend=self.backend, quantize_cpu=self.quantize_cpu
+                    )
         return self._pipeline
     
+    def warm_up(self):
+        """Load the models ahead of the first analysis; on failure, retry on first use."""
+        try:
+            self.pipeline
+        except Exception as e:
+            print(f"Warning: Image pipeline warm-up failed: {e}")
+    
     def analyze_images(self, image_paths: List[str]) -> dict:
         """
         Analyze a list of images and return aggregated results.
@@ -41,38 +58,22 @@ class PipelineService:
         Returns:
             Aggregated analysis result as a dictionary
         """
-        # Initialize aggregated results
-        aggregated = {
-            "total_faces": 0,
-            "gender": {"male": 0, "female": 0},
-            "age_group": {"10s": 0, "20s": 0, "30s": 0, "40_plus": 0}
-        }
-        
+        existing_paths = []
         for img_path in image_paths:
-            if not os.path.exists(img_path):
+            if os.path.exists(img_path):
+                existing_paths.append(img_path)
+            else:
                 print(f"Warning: Image not found: {img_path}")
-                continue
-            
-            try:
-                face_results = self.pipeline.process_image(img_path)
-                
-                for face in face_results:
-                    aggregated["total_faces"] += 1
-                    
-                    # Count gender
-                    gender = face["gender"].lower()
-                    if gender in aggregated["gender"]:
-                        aggregated["gender"][gender] += 1
-                    
-                    # Count age group
-                    age_group = face["age_group"]
-                    if age_group in aggregated["age_group"]:
-                        aggregated["age_group"][age_group] += 1
-                        
-            except Exception as e:
-                print(f"Error processing {img_path}: {e}")
         
-        return aggregated
+        # Run all images through the pipeline in batches, tallying classes per batch
+        # (only the counts are stored, so no per-face results are built)
+        counts = self.pipeline.empty_counts()
+        face_counts = self.pipeline.process_images(existing_paths, counts=counts)
+        for img_path, num_faces in zip(existing_paths, face_counts):
+            if num_faces is None:
+                print(f"Error processing {img_path}: could not read image")
+        
+        return self.pipeline.summarize_counts(counts)
     
     def analyze_directory(self, directory_path: str) -> dict:
         """
@@ -95,5 +96,11 @@ def get_pipeline_service() -> PipelineService:
     """Get or create pipeline service instance."""
     global _pipeline_service
     if _pipeline_service is None:
-        _pipeline_service = PipelineService(device='cpu')
+        settings = get_settings()
+        # Empty PIPELINE_DEVICE lets the pipeline auto-detect (cuda > mps > cpu)
+        _pipeline_service = PipelineService(
+            device=settings.pipeline_device or None,
+            backend=settings.pipeline_backend,
+            quantize_cpu=settings.pipeline_quantize_cpu
+        )
     return _pipeline_service
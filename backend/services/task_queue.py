@@ -0,0 +1,124 @@
+"""
+Task Queue: Bounded worker pool for image analysis jobs.
+Runs the pipeline off the request path with a fixed number of concurrent analyses.
+"""
+
+import os
+import asyncio
+from datetime import datetime
+from typing import List, Optional, Set
+
+import orjson
+from sqlalchemy import select, update
+
+from ..database import AsyncSessionLocal, Analysis
+from .pipeline_service import get_pipeline_service
+
+# Maximum number of analyses running at once
+MAX_WORKERS = min(os.cpu_count() or 1, 4)
+
+
+class AnalysisQueue:
+    """
+    Queue of pending analyses drained by a fixed pool of worker coroutines.
+    The pool size bounds how many pipeline runs compete for CPU at once.
+    """
+
+    def __init__(self, num_workers: int = MAX_WORKERS):
+        self.num_workers = num_workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._running: Set[str] = set()
+
+    def start(self):
+        """Start the worker pool on the running event loop."""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+
+    async def stop(self):
+        """
+        Cancel all workers and put unfinished analyses back to pending.
+        
+        Queued analyses and in-flight ones whose result is discarded by the
+        cancellation would otherwise stay "processing" and could never be restarted.
+        """
+        # Snapshot in-flight analyses first; cancelled workers drop them from _running
+        unfinished = set(self._running)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        
+        if self._queue is not None:
+            while not self._queue.empty():
+                analysis_id, _ = self._queue.get_nowait()
+                unfinished.add(analysis_id)
+        if unfinished:
+            await self._reset_to_pending(unfinished)
+    
+    @staticmethod
+    async def _reset_to_pending(analysis_ids: Set[str]):
+        """Mark analyses that never got a result as pending again."""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(Analysis)
+                .where(Analysis.analysis_id.in_(analysis_ids), Analysis.status == "processing")
+                .values(status="pending", updated_at=datetime.utcnow())
+            )
+            await db.commit()
+
+    async def submit(self, analysis_id: str, image_paths: List[str]):
+        """Queue an analysis, starting the workers if needed."""
+        self.start()
+        await self._queue.put((analysis_id, image_paths))
+
+    async def _worker(self):
+        """Take analyses off the queue one at a time."""
+        while True:
+            analysis_id, image_paths = await self._queue.get()
+            self._running.add(analysis_id)
+            try:
+                await self._run(analysis_id, image_paths)
+            except Exception as e:
+                print(f"Error running analysis {analysis_id}: {e}")
+            finally:
+                self._running.discard(analysis_id)
+                self._queue.task_done()
+
+    @staticmethod
+    async def _run(analysis_id: str, image_paths: List[str]):
+        """Run the pipeline in a worker thread and store the result."""
+        try:
+            pipeline_service = get_pipeline_service()
+            result = await asyncio.to_thread(pipeline_service.analyze_images, image_paths)
+            error = None
+        except Exception as e:
+            result, error = None, e
+
+        async with AsyncSessionLocal() as db:
+            analysis = await db.scalar(select(Analysis).where(Analysis.analysis_id == analysis_id))
+            if not analysis:
+                return
+
+            if error is None:
+                analysis.set_result(result)
+                analysis.status = "completed"
+            else:
+                analysis.status = "failed"
+                analysis.json_result = orjson.dumps({"error": str(error)}).decode()
+            analysis.updated_at = datetime.utcnow()
+            await db.commit()
+
+
+# Singleton instance
+_analysis_queue: Optional[AnalysisQueue] = None
+
+
+def get_analysis_queue() -> AnalysisQueue:
+    """Get or create analysis queue instance."""
+    global _analysis_queue
+    if _analysis_queue is None:
+        _analysis_queue = AnalysisQueue()
+    return _analysis_queue
@@ -6,52 +6,369 @@ Processes images and outputs aggregated statistics in JSON format.
 import os
 import sys
 import json
-import glob
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from PIL import Image
+import numpy as np
 import torch
 import cv2
+from torchvision.transforms import functional as TF
 
 from huggingface_hub import hf_hub_download
 from ultralytics import YOLO
 from transformers import ViTForImageClassification, ViTImageProcessor
 
+# Images per face detector call
+DETECT_BATCH_SIZE = 8
+# Face crops per classifier forward pass (crops are pooled across images)
+CLASSIFY_BATCH_SIZE = 32
+# Smaller boxes are likely false positives or too small for classification.
+# Minimum size reduced to 10x10 to handle group photos with many small faces
+MIN_FACE_SIZE = 10
+# Supported image extensions
+IMAGE_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png", ".bmp", ".webp"})
+# Per-image log lines are buffered and written in chunks of this many
+LOG_FLUSH_LINES = 100
+
+# Output age groups; classification works with indices into this tuple
+AGE_GROUPS = ("10s", "20s", "30s", "40_plus")
+# Genders reported in the aggregated result
+GENDERS = ("male", "female")
+
+# Exported ViT graphs for the ONNX Runtime backend
+ONNX_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx_cache")
+# Preferred ONNX Runtime execution providers, best first
+ONNX_PROVIDERS = ["TensorrtExecutionProvider", "CUDAExecutionProvider", "CPUExecutionProvider"]
+
 
 class ImagePipeline:
     """Pipeline for face detection, gender classification, and age classification."""
     
-    def __init__(self, device='cpu'):
-        self.device = torch.device(device)
-        print("Loading models...")
+    def __init__(self, device=None, quantize_cpu=False, backend='torch', compile_models=True,
+                 cuda_graphs=True, verbose=False):
+        """
+        Args:
+            device: Torch device for the models; auto-detected (cuda > mps > cpu) if None
+            quantize_cpu: Apply dynamic INT8 quantization to the ViTs on CPU
+            backend: 'torch' for eager PyTorch, or 'onnx' to serve all three models
+                through ONNX Runtime (requires the onnxruntime package)
+            compile_models: Compile the ViTs with torch.compile (CUDA, torch backend only)
+            cuda_graphs: Capture the ViT forward in a CUDA Graph when it is not compiled
+                (CUDA, torch backend only)
+            verbose: Log per-image face counts and [DEBUG] detection details
+        """
+        if backend not in ('torch', 'onnx'):
+            raise ValueError(f"Unknown backend: {backend}")
+        self.device = torch.device(device or self._default_device())
+        self.backend = backend
+        self.verbose = verbose
+        # Half precision halves ViT matmul cost on GPU; CPU stays in FP32
+        self.dtype = torch.float16 if self.device.type == 'cuda' and backend == 'torch' else torch.float32
+        # Optional dynamic INT8 quantization of the ViT linear layers on CPU
+        self.quantize_cpu = quantize_cpu and self.device.type == 'cpu' and backend == 'torch'
+        self.compile_models = compile_models and self.device.type == 'cuda' and backend == 'torch'
+        self.cuda_graphs = cuda_graphs and self.device.type == 'cuda' and backend == 'torch'
+        self._onnx_sessions = {}
+        self._compiled_models = {}
+        # name -> (graph, static input, static logits); replays share the static buffers
+        self._cuda_graphs = {}
+        # Serializes CUDA Graph replays and compiled (reduce-overhead) calls, whose
+        # output buffers are reused by the next call from any thread
+        self._graph_lock = threading.Lock()
+        # Per-thread pixel_values buffers (analyses may classify concurrently)
+        self._local = threading.local()
+        # The YOLO predictor is not thread-safe; serialize detection across threads
+        self._detect_lock = threading.Lock()
+        print(f"Loading models on {self.device}...")
         self._load_models()
         print("All models loaded successfully!\n")
     
+    @staticmethod
+    def _default_device() -> str:
+        """Pick the fastest available device."""
+        if torch.cuda.is_available():
+            return 'cuda'
+        if torch.backends.mps.is_available():
+            return 'mps'
+        return 'cpu'
+    
     def _load_models(self):
-        """Load all required models."""
-        # 1. YOLOv8 Face Detection
-        print("  [1/3] Loading YOLOv8 Face Detection model...")
-        yolo_model_path = hf_hub_download(
-            repo_id="arnabdhar/YOLOv8-Face-Detection",
-            filename="model.pt",
+        """
+        Load all required models.
+        
+        Downloads and weight loading for the three models run in parallel threads;
+        device placement, precision and compilation happen on the calling thread.
+        """
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            yolo_future = pool.submit(
+                hf_hub_download,
+                repo_id="arnabdhar/YOLOv8-Face-Detection",
+                filename="model.pt",
+            )
+            gender_future = pool.submit(self._load_classifier, "rizvandwiki/gender-classification")
+            age_future = pool.submit(self._load_classifier, "nateraw/vit-age-classifier")
+            
+            # 1. YOLOv8 Face Detection
+            yolo_model_path = yolo_future.result()
+            print("  [1/3] Loaded YOLOv8 Face Detection model")
+            if self.backend == 'onnx':
+                self.face_detector = YOLO(self._export_yolo_onnx(yolo_model_path), task="detect")
+            else:
+                self.face_detector = YOLO(yolo_model_path)
+                self.face_detector.to(self.device)
+            
+            # 2. Gender Classification
+            self.gender_model, self.gender_processor = gender_future.result()
+            print("  [2/3] Loaded Gender Classification model")
+            self.gender_model = self._prepare_classifier("gender", self.gender_model)
+            self._gender_norm = self._norm_constants(self.gender_processor)
+            self._compile_classifier("gender", self.gender_model, self._gender_norm)
+            self._capture_cuda_graph("gender", self.gender_model, self._gender_norm)
+            gender_id2label = self.gender_model.config.id2label
+            self._gender_names = tuple(gender_id2label[i].lower() for i in range(len(gender_id2label)))
+            
+            # 3. Age Classification
+            self.age_model, self.age_processor = age_future.result()
+            print("  [3/3] Loaded Age Classification model")
+            self.age_model = self._prepare_classifier("age", self.age_model)
+            self._age_norm = self._norm_constants(self.age_processor)
+            self._compile_classifier("age", self.age_model, self._age_norm)
+            self._capture_cuda_graph("age", self.age_model, self._age_norm)
+        
+        # Both ViTs normally share the input size and normalization, so one
+        # preprocessed batch can feed both models
+        self._shared_preprocessing = (
+            self.gender_processor.size == self.age_processor.size
+            and self.gender_processor.rescale_factor == self.age_processor.rescale_factor
+            and list(self.gender_processor.image_mean) == list(self.age_processor.image_mean)
+            and list(self.gender_processor.image_std) == list(self.age_processor.image_std)
+        )
+        if not self._shared_preprocessing:
+            print("  Warning: gender and age processors differ; preprocessing each model separately")
+        
+        # Age class index -> AGE_GROUPS index, gathered for a whole batch at once
+        age_id2label = self.age_model.config.id2label
+        self._age_idx_to_group = np.array(
+            [AGE_GROUPS.index(self._map_age_to_group(age_id2label[i])) for i in range(len(age_id2label))],
+            dtype=np.intp
         )
-        self.face_detector = YOLO(yolo_model_path)
-        self.face_detector.to(self.device)
-        
-        # 2. Gender Classification
-        print("  [2/3] Loading Gender Classification model...")
-        gender_model_id = "rizvandwiki/gender-classification"
-        self.gender_model = ViTForImageClassification.from_pretrained(gender_model_id)
-        self.gender_processor = ViTImageProcessor.from_pretrained(gender_model_id)
-        self.gender_model.to(self.device)
-        self.gender_model.eval()
-        
-        # 3. Age Classification
-        print("  [3/3] Loading Age Classification model...")
-        age_model_id = "nateraw/vit-age-classifier"
-        self.age_model = ViTForImageClassification.from_pretrained(age_model_id)
-        self.age_processor = ViTImageProcessor.from_pretrained(age_model_id)
-        self.age_model.to(self.device)
-        self.age_model.eval()
+    
+    @staticmethod
+    def _load_classifier(model_id: str) -> tuple:
+        """Download and load a ViT classifier and its processor on the CPU."""
+        model = ViTForImageClassification.from_pretrained(model_id)
+        processor = ViTImageProcessor.from_pretrained(model_id)
+        return model, processor
+    
+    def _prepare_classifier(self, name: str, model):
+        """Move a ViT classifier to the device in inference precision."""
+        model.eval()
+        if self.backend == 'onnx':
+            self._onnx_sessions[name] = self._load_onnx_session(name, model)
+            return model
+        if self.quantize_cpu:
+            return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model.to(self.device, dtype=self.dtype)
+    
+    def _export_yolo_onnx(self, model_path: str) -> str:
+        """Export the YOLO weights to ONNX next to the .pt file, once."""
+        onnx_path = os.path.splitext(model_path)[0] + ".onnx"
+        if not os.path.exists(onnx_path):
+            on_gpu = self.device.type == 'cuda'
+            onnx_path = YOLO(model_path).export(
+                format="onnx", dynamic=True, half=on_gpu, device=(self.device.index or 0) if on_gpu else "cpu"
+            )
+        return onnx_path
+    
+    @staticmethod
+    def _onnx_cache_path(model) -> str:
+        """
+        Cache file for a ViT's exported graph, keyed on the model id and a hash of its
+        config and checkpoint revision, so a changed checkpoint is exported again.
+        """
+        model_id = model.config._name_or_path.replace("/", "--")
+        hasher = hashlib.sha256(model.config.to_json_string().encode())
+        hasher.update(str(getattr(model.config, "_commit_hash", "")).encode())
+        return os.path.join(ONNX_CACHE_DIR, f"{model_id}-{hasher.hexdigest()[:16]}.onnx")
+    
+    def _load_onnx_session(self, name: str, model):
+        """Export a ViT classifier to ONNX (cached on disk) and open an inference session."""
+        import onnxruntime as ort
+        
+        onnx_path = self._onnx_cache_path(model)
+        if not os.path.exists(onnx_path):
+            print(f"  Exporting {name} model to {onnx_path}")
+            os.makedirs(ONNX_CACHE_DIR, exist_ok=True)
+            image_size = model.config.image_size
+            dummy_input = torch.zeros(1, model.config.num_channels, image_size, image_size)
+            # Export under a temp name and rename, so an interrupted export never
+            # leaves a truncated graph that later starts would load
+            tmp_path = f"{onnx_path}.{os.getpid()}.tmp"
+            model.config.return_dict = False
+            try:
+                torch.onnx.export(
+                    model, (dummy_input,), tmp_path,
+                    input_names=["pixel_values"],
+                    output_names=["logits"],
+                    dynamic_axes={"pixel_values": {0: "N"}, "logits": {0: "N"}},
+                    opset_version=17
+                )
+                os.replace(tmp_path, onnx_path)
+            finally:
+                model.config.return_dict = True
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        available = ort.get_available_providers()
+        providers = [provider for provider in ONNX_PROVIDERS if provider in available]
+        if "TensorrtExecutionProvider" in providers:
+            providers[0] = ("TensorrtExecutionProvider", {"trt_fp16_enable": True})
+        return ort.InferenceSession(onnx_path, options, providers=providers)
+    
+    def _compile_classifier(self, name: str, model, norm: tuple):
+        """
+        Compile a ViT classifier and warm it up on a fixed (CLASSIFY_BATCH_SIZE, 3, H, W) input.
+        
+        Warming up at load time pays the compile cost before the first image.
+        Falls back to eager mode if compilation fails.
+        """
+        if not self.compile_models:
+            return
+        size, _, _ = norm
+        compiled = torch.compile(model, mode="reduce-overhead", fullgraph=True)
+        dummy_input = torch.zeros(CLASSIFY_BATCH_SIZE, 3, *size, device=self.device, dtype=self.dtype)
+        try:
+            # Same grad mode as inference calls, so the compiled graph's guards match
+            with torch.inference_mode():
+                # reduce-overhead records its CUDA graph after a few warm-up runs
+                for _ in range(3):
+                    compiled(pixel_values=dummy_input)
+        except Exception as e:
+            print(f"  Warning: torch.compile failed for {name} model, using eager mode: {e}")
+            return
+        self._compiled_models[name] = compiled
+    
+    def _capture_cuda_graph(self, name: str, model, norm: tuple):
+        """
+        Capture an eager ViT classifier's forward on a fixed (CLASSIFY_BATCH_SIZE, 3, H, W)
+        input in a CUDA Graph, so each batch is one graph replay instead of dozens of
+        kernel launches.
+        
+        Skipped for compiled models (reduce-overhead mode already uses CUDA Graphs).
+        Falls back to eager mode if capture fails.
+        """
+        if not self.cuda_graphs or name in self._compiled_models:
+            return
+        size, _, _ = norm
+        static_input = torch.zeros(CLASSIFY_BATCH_SIZE, 3, *size, device=self.device, dtype=self.dtype)
+        try:
+            with torch.inference_mode():
+                # Warm up on a side stream before capturing, as CUDA Graphs require
+                stream = torch.cuda.Stream(device=self.device)
+                stream.wait_stream(torch.cuda.current_stream(self.device))
+                with torch.cuda.stream(stream):
+                    for _ in range(3):
+                        model(pixel_values=static_input)
+                torch.cuda.current_stream(self.device).wait_stream(stream)
+                
+                graph = torch.cuda.CUDAGraph()
+                with torch.cuda.graph(graph):
+                    static_logits = model(pixel_values=static_input).logits
+        except Exception as e:
+            print(f"  Warning: CUDA Graph capture failed for {name} model, using eager mode: {e}")
+            return
+        self._cuda_graphs[name] = (graph, static_input, static_logits)
+    
+    def _classifier_logits(self, name: str, model, pixel_values: torch.Tensor) -> torch.Tensor:
+        """
+        Run a ViT classifier on a pixel_values batch through the configured backend.
+        
+        Must be called under torch.inference_mode (the public entry points enter it).
+        """
+        if self.backend == 'onnx':
+            (logits,) = self._onnx_sessions[name].run(None, {"pixel_values": pixel_values.cpu().numpy()})
+            return torch.from_numpy(logits)
+        
+        num_crops = pixel_values.shape[0]
+        cuda_graph = self._cuda_graphs.get(name)
+        if cuda_graph is not None and num_crops <= CLASSIFY_BATCH_SIZE:
+            graph, static_input, static_logits = cuda_graph
+            # The static buffers are shared, so copy in, replay and copy out under a lock
+            with self._graph_lock:
+                static_input[:num_crops].copy_(pixel_values)
+                static_input[num_crops:].zero_()
+                graph.replay()
+                return static_logits[:num_crops].clone()
+        
+        compiled = self._compiled_models.get(name)
+        if compiled is None:
+            return model(pixel_values=pixel_values).logits
+        
+        # Pad partial batches to the warmed-up shape so the compiled graph is reused
+        padded = pixel_values
+        if num_crops < CLASSIFY_BATCH_SIZE:
+            padding = pixel_values.new_zeros(CLASSIFY_BATCH_SIZE - num_crops, *pixel_values.shape[1:])
+            padded = torch.cat([pixel_values, padding])
+        try:
+            with self._graph_lock:
+                return compiled(pixel_values=padded).logits[:num_crops].clone()
+        except Exception as e:
+            # e.g. a recompile or graph capture failing on a worker thread
+            print(f"Warning: compiled {name} model failed, using eager mode: {e}")
+            self._compiled_models.pop(name, None)
+            return model(pixel_values=pixel_values).logits
+    
+    def _norm_constants(self, processor) -> tuple:
+        """
+        Resize target and normalization constants of a ViT processor, cached on the device.
+        
+        The processor's 1/255 rescale is folded into mean/std so uint8 crops are
+        normalized with a single subtract and divide.
+        """
+        size = [processor.size["height"], processor.size["width"]]
+        scale = 1.0 / processor.rescale_factor
+        mean = torch.tensor(processor.image_mean, device=self.device).view(1, -1, 1, 1) * scale
+        std = torch.tensor(processor.image_std, device=self.device).view(1, -1, 1, 1) * scale
+        return size, mean, std
+    
+    def _pixel_buffer(self, num_crops: int, size: list) -> torch.Tensor:
+        """
+        Reusable batch buffer in the model dtype for `num_crops` images of `size`, kept per thread.
+        
+        Allocated once at CLASSIFY_BATCH_SIZE (grown only for larger batches) so
+        preprocessing does not allocate a new batch tensor on every call, including
+        the FP16 batch on CUDA.
+        """
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        key = tuple(size)
+        buffer = buffers.get(key)
+        if buffer is None or buffer.shape[0] < num_crops:
+            buffer = torch.empty(
+                max(num_crops, CLASSIFY_BATCH_SIZE), 3, *size, device=self.device, dtype=self.dtype
+            )
+            buffers[key] = buffer
+        return buffer[:num_crops]
+    
+    def _preprocess(self, face_crops: list, norm: tuple) -> torch.Tensor:
+        """
+        Resize and normalize CHW uint8 crops into a ViT pixel_values batch.
+        
+        The result may be a view of this thread's reusable buffer; it is only valid
+        until the next call on the same thread.
+        """
+        size, mean, std = norm
+        batch = self._pixel_buffer(len(face_crops), size)
+        for i, crop in enumerate(face_crops):
+            # Normalize in float32, then cast while copying into the buffer
+            resized = TF.resize(crop.unsqueeze(0).float(), size, antialias=True)
+            batch[i] = resized.sub_(mean).div_(std)[0]
+        return batch
     
     def _map_age_to_group(self, age_label: str) -> str:
         """Map model age label to output age group."""
@@ -68,91 +385,225 @@ class ImagePipeline:
         }
         return age_mapping.get(age_label, "40_plus")
     
-    def detect_faces(self, image_path: str):
-        """Detect faces in an image and return bounding boxes."""
-        results = self.face_detector(image_path, verbose=False)
+    def detect_faces(self, image_path: str, image=None):
+        """
+        Detect faces in an image and return bounding boxes.
         
-        # Debug: Check raw detection count
-        raw_count = len(results[0].boxes)
-        print(f"    [DEBUG] Raw YOLO detections: {raw_count}")
+        Pass the already decoded BGR array as `image` to skip reading the file again.
+        """
+        if image is None:
+            image = cv2.imread(image_path)
+            if image is None:
+                raise ValueError(f"Could not read image: {image_path}")
+        xyxy, conf = self.detect_faces_batch([image])[0]
+        return [
+            {"bbox": bbox, "confidence": confidence}
+            for bbox, confidence in zip(xyxy.tolist(), conf.tolist())
+        ]
+    
+    def detect_faces_batch(self, images: list) -> list:
+        """
+        Detect faces in a batch of images (paths or BGR arrays) with one detector call.
+        
+        Returns one (xyxy, conf) pair of aligned arrays per image: int32 boxes of
+        shape (N, 4) clipped to the image, and their confidences. Boxes under
+        MIN_FACE_SIZE are removed here, before any cropping.
+        """
+        with self._detect_lock:
+            results = self.face_detector(images, verbose=False)
         
-        faces = []
-        for box in results[0].boxes:
-            x1, y1, x2, y2 = box.xyxy[0].tolist()
-            conf = box.conf[0].item()
-            faces.append({
-                "bbox": [int(x1), int(y1), int(x2), int(y2)],
-                "confidence": conf
-            })
-        return faces
+        batch_boxes = []
+        for result in results:
+            if self.verbose:
+                print(f"    [DEBUG] Raw YOLO detections: {len(result.boxes)}")
+            
+            # One device->host copy per array instead of one per box
+            xyxy = result.boxes.xyxy.cpu().numpy().astype(np.int32)
+            conf = result.boxes.conf.cpu().numpy()
+            
+            # Clip to the image so the size check matches the crop that will be taken
+            height, width = result.orig_shape[:2]
+            np.clip(xyxy[:, 0::2], 0, width, out=xyxy[:, 0::2])
+            np.clip(xyxy[:, 1::2], 0, height, out=xyxy[:, 1::2])
+            
+            keep = ((xyxy[:, 2] - xyxy[:, 0]) >= MIN_FACE_SIZE) & ((xyxy[:, 3] - xyxy[:, 1]) >= MIN_FACE_SIZE)
+            if self.verbose and not keep.all():
+                print(f"    [DEBUG] Skipped {len(keep) - keep.sum()} faces (too small < {MIN_FACE_SIZE}x{MIN_FACE_SIZE})")
+            batch_boxes.append((xyxy[keep], conf[keep]))
+        return batch_boxes
+    
+    def _pil_to_tensor(self, face_image: Image.Image) -> torch.Tensor:
+        """Convert a PIL face image to a CHW uint8 RGB tensor on the device."""
+        return TF.pil_to_tensor(face_image.convert("RGB")).to(self.device)
     
     def classify_gender(self, face_image: Image.Image) -> str:
         """Classify gender of a face image."""
-        inputs = self.gender_processor(images=face_image, return_tensors="pt").to(self.device)
-        with torch.no_grad():
-            outputs = self.gender_model(**inputs)
-            predicted_idx = outputs.logits.argmax(-1).item()
-        return self.gender_model.config.id2label[predicted_idx]
+        return self.classify_genders([self._pil_to_tensor(face_image)])[0]
     
     def classify_age(self, face_image: Image.Image) -> str:
         """Classify age of a face image and return mapped age group."""
-        inputs = self.age_processor(images=face_image, return_tensors="pt").to(self.device)
-        with torch.no_grad():
-            outputs = self.age_model(**inputs)
-            predicted_idx = outputs.logits.argmax(-1).item()
-        age_label = self.age_model.config.id2label[predicted_idx]
-        return self._map_age_to_group(age_label)
-    
-    def process_image(self, image_path: str) -> list:
-        """Process a single image: detect faces and classify each."""
-        # Detect faces
-        faces = self.detect_faces(image_path)
-        
-        if not faces:
-            return []
-        
-        # Load original image for cropping
-        original_image = Image.open(image_path).convert('RGB')
-        
-        results = []
-        skipped_small = 0
-        for face in faces:
-            x1, y1, x2, y2 = face["bbox"]
+        return self.classify_ages([self._pil_to_tensor(face_image)])[0]
+    
+    @torch.inference_mode()
+    def classify_genders(self, face_crops: list) -> list:
+        """Classify gender of a batch of CHW uint8 face crops in one forward pass."""
+        id2label = self.gender_model.config.id2label
+        pixel_values = self._preprocess(face_crops, self._gender_norm)
+        return [id2label[idx] for idx in self._gender_indices(pixel_values).tolist()]
+    
+    @torch.inference_mode()
+    def classify_ages(self, face_crops: list) -> list:
+        """Classify age of a batch of CHW uint8 face crops in one forward pass and return mapped age groups."""
+        pixel_values = self._preprocess(face_crops, self._age_norm)
+        return [AGE_GROUPS[idx] for idx in self._age_group_indices(pixel_values).tolist()]
+    
+    def _classify_indices(self, face_crops: list) -> tuple:
+        """
+        Gender class index and AGE_GROUPS index of each crop.
+        
+        The crops are preprocessed once and fed to both models when their
+        processors match.
+        """
+        pixel_values = self._preprocess(face_crops, self._gender_norm)
+        # Read the gender result before the buffer can be reused for the age batch
+        gender_indices = self._gender_indices(pixel_values)
+        if not self._shared_preprocessing:
+            pixel_values = self._preprocess(face_crops, self._age_norm)
+        return gender_indices, self._age_group_indices(pixel_values)
+    
+    def _gender_indices(self, pixel_values: torch.Tensor) -> np.ndarray:
+        """Gender class index of each image in a pixel_values batch."""
+        logits = self._classifier_logits("gender", self.gender_model, pixel_values)
+        return logits.argmax(-1).cpu().numpy()
+    
+    def _age_group_indices(self, pixel_values: torch.Tensor) -> np.ndarray:
+        """AGE_GROUPS index of each image in a pixel_values batch."""
+        logits = self._classifier_logits("age", self.age_model, pixel_values)
+        return self._age_idx_to_group[logits.argmax(-1).cpu().numpy()]
+    
+    def empty_counts(self) -> dict:
+        """Zeroed face tallies indexed like the classifier outputs, for process_images(counts=...)."""
+        return {
+            "gender": np.zeros(len(self._gender_names), dtype=np.int64),
+            "age_group": np.zeros(len(AGE_GROUPS), dtype=np.int64)
+        }
+    
+    def summarize_counts(self, counts: dict) -> dict:
+        """Convert face tallies to the aggregated JSON result layout."""
+        gender_counts = dict(zip(self._gender_names, counts["gender"].tolist()))
+        return {
+            "total_faces": int(counts["age_group"].sum()),
+            "gender": {gender: gender_counts.get(gender, 0) for gender in GENDERS},
+            "age_group": dict(zip(AGE_GROUPS, counts["age_group"].tolist()))
+        }
+    
+    def process_image(self, image_path: str, counts: dict = None):
+        """
+        Process a single image: detect faces and classify each.
+        
+        Returns the list of face results, or, if a `counts` accumulator (from
+        empty_counts) is given, tallies the faces into it and returns the face count.
+        """
+        results = self.process_images([image_path], counts=counts)[0]
+        if results is None:
+            raise ValueError(f"Could not read image: {image_path}")
+        return results
+    
+    @torch.inference_mode()
+    def process_images(self, image_paths: list, batch_size: int = DETECT_BATCH_SIZE, counts: dict = None) -> list:
+        """
+        Process images in two stages: one detector call per batch of images, then
+        classification of the pooled face crops in batches of CLASSIFY_BATCH_SIZE.
+        
+        The whole run is one torch.inference_mode region.
+        
+        Images are read in parallel threads (I/O-bound, cv2 releases the GIL), one
+        batch ahead, so decoding the next batch overlaps inference on the current one.
+        Returns one face result list per input path, or None for unreadable images.
+        
+        If `counts` (from empty_counts) is given, faces are only tallied into it:
+        no per-face results are built and each entry is the image's face count.
+        """
+        results = [None] * len(image_paths)
+        # Pending crops and, when building face results, their (image index, detection) provenance
+        crops, metas = [], []
+        with ThreadPoolExecutor(max_workers=batch_size) as pool:
+            next_reads = [pool.submit(cv2.imread, path) for path in image_paths[:batch_size]]
+            for start in range(0, len(image_paths), batch_size):
+                images = [read.result() for read in next_reads]
+                # Prefetch the following batch before running the models
+                next_paths = image_paths[start + batch_size:start + 2 * batch_size]
+                next_reads = [pool.submit(cv2.imread, path) for path in next_paths]
+                
+                readable = [i for i, image in enumerate(images) if image is not None]
+                if not readable:
+                    continue
+                detections = self.detect_faces_batch([images[i] for i in readable])
+                for i, (xyxy, conf) in zip(readable, detections):
+                    crops.extend(self._crop_faces(images[i], xyxy))
+                    if counts is None:
+                        results[start + i] = []
+                        metas.extend((start + i, face) for face in zip(xyxy.tolist(), conf.tolist()))
+                    else:
+                        results[start + i] = len(xyxy)
+                
+                if len(crops) >= CLASSIFY_BATCH_SIZE:
+                    self._flush_classification_batch(crops, metas, results, counts)
+        
+        self._flush_classification_batch(crops, metas, results, counts)
+        return results
+    
+    def _crop_faces(self, image, xyxy: np.ndarray) -> list:
+        """Crop detected faces from a BGR image as CHW RGB tensors on the device."""
+        crops = []
+        # Boxes are already clipped and size-filtered by detect_faces_batch
+        for x1, y1, x2, y2 in xyxy.tolist():
+            # Crop face region from the same decoded array the detector saw (view, no copy)
+            face_crop = image[y1:y2, x1:x2]
             
-            # Crop face region
-            face_crop = original_image.crop((x1, y1, x2, y2))
+            # Only the crop is converted: BGR HWC -> RGB CHW tensor on the device
+            face_crop = torch.from_numpy(np.ascontiguousarray(face_crop[:, :, ::-1]))
+            crops.append(face_crop.to(self.device).permute(2, 0, 1))
+        return crops
+    
+    def _flush_classification_batch(self, crops: list, metas: list, results: list, counts: dict = None):
+        """
+        Classify the pending crops and append each face to its image's result list,
+        or only tally the classes into `counts` if given.
+        
+        Runs one forward pass per model per CLASSIFY_BATCH_SIZE crops, then empties
+        the pending lists in place.
+        """
+        gender_labels = self.gender_model.config.id2label
+        for start in range(0, len(crops), CLASSIFY_BATCH_SIZE):
+            batch_crops = crops[start:start + CLASSIFY_BATCH_SIZE]
+            gender_indices, group_indices = self._classify_indices(batch_crops)
             
-            # Skip very small faces (likely false positives or too small for classification)
-            # Minimum size reduced to 10x10 to handle group photos with many small faces
-            if face_crop.width < 10 or face_crop.height < 10:
-                skipped_small += 1
+            if counts is not None:
+                counts["gender"] += np.bincount(gender_indices, minlength=len(self._gender_names))
+                counts["age_group"] += np.bincount(group_indices, minlength=len(AGE_GROUPS))
                 continue
             
-            # Classify gender and age
-            gender = self.classify_gender(face_crop)
-            age_group = self.classify_age(face_crop)
-            
-            results.append({
-                "bbox": face["bbox"],
-                "confidence": face["confidence"],
-                "gender": gender,
-                "age_group": age_group
-            })
-        
-        if skipped_small > 0:
-            print(f"    [DEBUG] Skipped {skipped_small} faces (too small < 10x10)")
-        
-        return results
+            for (img_idx, (bbox, confidence)), gender_idx, group_idx in zip(
+                metas[start:start + CLASSIFY_BATCH_SIZE], gender_indices.tolist(), group_indices.tolist()
+            ):
+                results[img_idx].append({
+                    "bbox": bbox,
+                    "confidence": confidence,
+                    "gender": gender_labels[gender_idx],
+                    "age_group": AGE_GROUPS[group_idx]
+                })
+        crops.clear()
+        metas.clear()
     
     def process_directory(self, input_dir: str) -> dict:
         """Process all images in a directory and aggregate results."""
-        # Supported image extensions
-        image_patterns = ["*.jpg", "*.jpeg", "*.png", "*.bmp", "*.webp"]
-        
-        # Gather all image file paths
-        image_paths = []
-        for pattern in image_patterns:
-            image_paths.extend(glob.glob(os.path.join(input_dir, pattern)))
+        # Gather all image file paths in one directory pass, in a stable order
+        with os.scandir(input_dir) as entries:
+            image_paths = sorted(
+                entry.path for entry in entries
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS
+            )
         
         if not image_paths:
             print(f"No images found in {input_dir}")
@@ -160,42 +611,30 @@ class ImagePipeline:
         
         print(f"Found {len(image_paths)} images in {input_dir}")
         
-        # Initialize counters
-        total_faces = 0
-        gender_counts = {"male": 0, "female": 0}
-        age_group_counts = {"10s": 0, "20s": 0, "30s": 0, "40_plus": 0}
+        # Detect and classify across images in batches, tallying classes as they go
+        # (no per-face results are kept)
+        counts = self.empty_counts()
+        face_counts = self.process_images(image_paths, counts=counts)
         
-        # Process each image
-        for i, img_path in enumerate(image_paths, 1):
-            img_name = os.path.basename(img_path)
-            print(f"  [{i}/{len(image_paths)}] Processing {img_name}...", end=" ")
+        # Unreadable images are always reported; per-image counts only when verbose.
+        # Lines are buffered and written in chunks instead of one print per image.
+        log_lines = []
+        for i, (img_path, num_faces) in enumerate(zip(image_paths, face_counts), 1):
+            if num_faces is None:
+                log_lines.append(f"  [{i}/{len(image_paths)}] Error: Could not read image: {img_path}")
+            elif self.verbose:
+                img_name = os.path.basename(img_path)
+                log_lines.append(f"  [{i}/{len(image_paths)}] {img_name}: {num_faces} faces detected")
             
-            try:
-                face_results = self.process_image(img_path)
-                num_faces = len(face_results)
-                total_faces += num_faces
-                
-                for face in face_results:
-                    # Count gender
-                    gender = face["gender"].lower()
-                    if gender in gender_counts:
-                        gender_counts[gender] += 1
-                    
-                    # Count age group
-                    age_group = face["age_group"]
-                    if age_group in age_group_counts:
-                        age_group_counts[age_group] += 1
-                
-                print(f"{num_faces} faces detected")
-                
-            except Exception as e:
-                print(f"Error: {e}")
+            if len(log_lines) >= LOG_FLUSH_LINES:
+                sys.stdout.write("\n".join(log_lines) + "\n")
+                log_lines.clear()
+        if log_lines:
+            sys.stdout.write("\n".join(log_lines) + "\n")
         
-        return {
-            "total_faces": total_faces,
-            "gender": gender_counts,
-            "age_group": age_group_counts
-        }
+        result = self.summarize_counts(counts)
+        print(f"Processed {len(image_paths)} images: {result['total_faces']} faces detected")
+        return result
     
     def run(self, input_dirs: list, output_path: str) -> dict:
         """Run the pipeline on multiple directories and save JSON result."""
@@ -251,7 +690,7 @@ def main():
     output_path = os.path.join(script_dir, "results", "pipeline_result.json")
     
     # Create and run pipeline
-    pipeline = ImagePipeline(device='cpu')
+    pipeline = ImagePipeline()
     result = pipeline.run(input_dirs, output_path)
     
     return result